@@ -15,6 +15,7 @@ import time
 import StringIO
 import multiprocessing
 import re
+import collections
 
 VERSION = ybs.settings.__version__
 PROCESSES_NUM = 4
@@ -26,10 +27,19 @@ IS_VERBOSE = False
 PBSLIB_PATH = ybs.settings.__pbslib_path__
 DEPEND_DB = ybs.settings.__depend_db__
 DEPEND_DB_TABLE = ybs.settings.__depend_db_table__
+DEPEND_DB_PBSFILE_TABLE = ybs.settings.__depend_db_pbsfile_table__
+DEPEND_DB_EDGES_TABLE = ybs.settings.__depend_db_edges_table__
+# Types of dependency, namely columns of DEPEND_DB_TABLE
+DEP_TYPES = ('rdep', 'bdep', 'redep', 'cdep')
 PACKAGE_DB = ybs.settings.__package_db__
 PACKAGE_DB_TABLE = ybs.settings.__package_db_table__
 
 
+class KeyboardInterruptError(Exception):
+    ''' raised in workers of pool on ^C, the pool terminates cleanly '''
+    pass
+
+
 def ybs_list_available(pbslib):
     ''' Display name and version of package in pbslib.
 
@@ -63,9 +73,7 @@ def ybs_list_installed(dbtable=PACKAGE_DB_TABLE, dbfile=PACKAGE_DB):
       A dict: {pkg_name: pkg_version, ...}
 
     '''
-    conn = sqlite3.connect(dbfile)
-    return {res[0]: res[1] for res in conn.execute("SELECT name, version FROM {}".format(dbtable))}
-    conn.close()
+    return ybs.utils.installed_snapshot(dbfile, dbtable).versions()
 
 
 def ybs_status(name):
@@ -103,7 +111,12 @@ def ybs_showpbs(name, pbslib):
         sys.stderr.write("'{}' not found in {}.\n".format(name, PBSLIB_PATH))
         sys.exit(1)
     else:
-        return ybs.utils.file_in_dir(PBSLIB_PATH, name + '_' + pbslib[name][-1] + '.pbs')
+        path = None
+        if isinstance(pbslib, ybs.utils.PbsLib):
+            path = pbslib.path(name)
+        if path is None:
+            path = ybs.utils.file_in_dir(PBSLIB_PATH, name + '_' + pbslib[name][-1] + '.pbs')
+        return path
 
 
 def ybs_search(name, pbslib):
@@ -160,43 +173,160 @@ def ybs_whatrequires(name, dbtable=DEPEND_DB_TABLE, dbfile=DEPEND_DB):
       dbfile: sqlite3 database created by pybs
 
     '''
+    flags = {'rdep': '[R]', 'bdep': '[B]', 'redep': '[A]', 'cdep': '[C]'}
     conn = sqlite3.connect(dbfile)
     cur = conn.cursor()
-    cur.execute("SELECT name, version FROM {};".format(dbtable))
-    # cur.fetchall() returns a list looks like:
-    # [(u'lxrandr', u'1.2'), (u'lxmenu-data', u'1,3',)]
-    for pkg in cur.fetchall():
-        pkg_name, pkg_version = pkg
+    cur.execute("SELECT DISTINCT u.rowid, u.name, u.version, e.type FROM {} e JOIN {} u ON u.name = e.pkg "
+                "WHERE e.dep = ?;".format(DEPEND_DB_EDGES_TABLE, dbtable), (name,))
+    # Keep order of packages in dbtable, and order of DEP_TYPES
+    for _, pkg_name, pkg_version, type_ in sorted(cur.fetchall(), key=lambda x: (x[0], DEP_TYPES.index(x[3]))):
         if SHOW_INSTALLED_ONLY:
             if not ybs.utils.installed_info(pkg_name):
                 continue
         if SHOW_UNINSTALLED_ONLY:
             if ybs.utils.installed_info(pkg_name):
                 continue
-        for type_ in ('rdep', '[R]'), ('bdep', '[B]'), ('redep', '[A]'), ('cdep', '[C]'):
-            type_, flag = type_
-            cur.execute("SELECT {} FROM {} WHERE name = '{}';".format(type_, dbtable, pkg_name))
-            # cur.fetchone() returns a tuple looks like:
-            # (u'gtk2(>=1.27) menu-cache startup-notification',)
-            deps = [x.split('(')[0] for x in cur.fetchone()[0].split()]
-            if name in deps:
-                #if ybs.utils.installed_info(pkg_name):
-                #    flag = flag + '[I]'
-                print('{} {} {}'.format(flag, pkg_name, pkg_version))
+        print('{} {} {}'.format(flags[type_], pkg_name, pkg_version))
     cur.close()
     conn.close()
 
 
-def ybs_update_db(dbfile=DEPEND_DB, dbtable=DEPEND_DB_TABLE):
+def ybs_update_db(dbfile=DEPEND_DB, dbtable=DEPEND_DB_TABLE, rebuild=False,
+                  processes_num=PROCESSES_NUM):
     ''' Update dbfile
 
+    Only pbsfiles added, changed or removed since last update are parsed,
+    changes are applied in one transaction. dbfile is rebuilt if rebuild
+    is True or it was created without pbsfile table.
+
     Args:
       dbfile: string, path to dbfile
+      rebuild: bool, delete dbfile and parse the whole pbslib
+      processes_num: int, numbers of muti-processings
 
     '''
+    if os.path.exists(dbfile) and not rebuild and is_db_current(dbfile):
+        conn = sqlite3.connect(dbfile)
+        _update_db(conn, dbtable, processes_num)
+        conn.close()
+        return
     if os.path.exists(dbfile):
         os.remove(dbfile)
-    ybs_init_db(dbfile, dbtable)
+    ybs_init_db(dbfile, dbtable, processes_num)
+
+
+def is_db_current(dbfile=DEPEND_DB):
+    ''' Check whether dbfile contains all the tables pybs needs
+
+    Args:
+      dbfile: string, path to dbfile
+
+    Returns:
+      bool values
+
+    '''
+    conn = sqlite3.connect(dbfile)
+    tables = [x[0] for x in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    conn.close()
+    return DEPEND_DB_PBSFILE_TABLE in tables and DEPEND_DB_EDGES_TABLE in tables
+
+
+def _create_tables(conn, dbtable):
+    ''' Create tables and indexes of dbfile
+
+    Args:
+      conn: sqlite3 connection
+      dbtable: string, table of dbfile
+
+    '''
+    conn.execute("CREATE TABLE IF NOT EXISTS {} (name TEXT, version TEXT, rdep TEXT, bdep TEXT, redep TEXT, cdep TEXT);".format(dbtable))
+    conn.execute("CREATE INDEX IF NOT EXISTS {0}_name ON {0} (name);".format(dbtable))
+    conn.execute("CREATE TABLE IF NOT EXISTS {} (path TEXT PRIMARY KEY, name TEXT, mtime REAL, sha1 TEXT);".format(DEPEND_DB_PBSFILE_TABLE))
+    # One row per dependency atom, such as 'zlib(>=1.2)' in rdep of curl:
+    # ('curl', 'zlib', 'rdep', '>=', '1.2')
+    conn.execute("CREATE TABLE IF NOT EXISTS {} (pkg TEXT, dep TEXT, type TEXT, op TEXT, version TEXT);".format(DEPEND_DB_EDGES_TABLE))
+    conn.execute("CREATE INDEX IF NOT EXISTS {0}_pkg ON {0} (pkg, type);".format(DEPEND_DB_EDGES_TABLE))
+    conn.execute("CREATE INDEX IF NOT EXISTS {0}_dep ON {0} (dep);".format(DEPEND_DB_EDGES_TABLE))
+
+
+def _insert_deps(conn, dbtable, path, res):
+    ''' Insert dependency of pbsfile to dbfile
+
+    Args:
+      conn: sqlite3 connection
+      dbtable: string, table of dbfile
+      path: string, path to pbsfile
+      res: tuple, looks like get_deps_from_file returns
+
+    '''
+    name = res[0]
+    conn.execute('INSERT INTO {} (name, version, rdep, bdep, redep, cdep) VALUES (?, ?, ?, ?, ?, ?)'.format(dbtable), res)
+    for type_, deps in zip(DEP_TYPES, res[2:]):
+        conn.executemany('INSERT INTO {} (pkg, dep, type, op, version) VALUES (?, ?, ?, ?, ?)'.format(DEPEND_DB_EDGES_TABLE),
+                         [(name, dep, type_, op, version) for dep, op, version in map(ybs.utils.split_depend, deps.split())])
+    # Record state of pbsfile for incremental update
+    conn.execute('INSERT OR REPLACE INTO {} (path, name, mtime, sha1) VALUES (?, ?, ?, ?)'.format(DEPEND_DB_PBSFILE_TABLE),
+                 (path, name, os.path.getmtime(path), ybs.utils.get_sha1sum(path)))
+
+
+def _delete_deps(conn, dbtable, name):
+    ''' Delete dependency of package from dbfile
+
+    Args:
+      conn: sqlite3 connection
+      dbtable: string, table of dbfile
+      name: string, name of package
+
+    '''
+    conn.execute('DELETE FROM {} WHERE name = ?'.format(dbtable), (name,))
+    conn.execute('DELETE FROM {} WHERE pkg = ?'.format(DEPEND_DB_EDGES_TABLE), (name,))
+
+
+def _update_db(conn, dbtable, processes_num):
+    ''' Apply changes of pbslib to dbfile
+
+    Args:
+      conn: sqlite3 connection of dbfile
+      dbtable: string, table of dbfile
+
+    '''
+    # {path: (name, mtime, sha1)}
+    stored = {}
+    for path, name, mtime, sha1 in conn.execute("SELECT path, name, mtime, sha1 FROM {}".format(DEPEND_DB_PBSFILE_TABLE)):
+        stored[path] = (name, mtime, sha1)
+    files = ybs.utils.pkgs_in_dir(PBSLIB_PATH, '.pbs', filter_by='version')
+    current = set(files)
+    removed = [x for x in stored if x not in current]
+    dirty = []
+    touched = []
+    for f in files:
+        mtime = os.path.getmtime(f)
+        if f not in stored:
+            dirty.append(f)
+            continue
+        if mtime == stored[f][1]:
+            continue
+        sha1 = ybs.utils.get_sha1sum(f)
+        if sha1 == stored[f][2]:
+            # Content is not changed, e.g. touched by git checkout
+            touched.append((mtime, f))
+        else:
+            dirty.append(f)
+    if not (removed or dirty or touched):
+        sys.stderr.write("'{}' is up to date.\n".format(PBSLIB_PATH))
+        return
+    sys.stderr.write("Updating dependency tree of '{}': {} added or changed, {} removed...\n".format(
+                     PBSLIB_PATH, len(dirty), len(removed)))
+    result = parse_pbsfiles(dirty, processes_num)
+    # Commit all the changes in one transaction
+    with conn:
+        for path in removed:
+            _delete_deps(conn, dbtable, stored[path][0])
+            conn.execute('DELETE FROM {} WHERE path = ?'.format(DEPEND_DB_PBSFILE_TABLE), (path,))
+        for path, res in result:
+            _delete_deps(conn, dbtable, res[0])
+            _insert_deps(conn, dbtable, path, res)
+        conn.executemany('UPDATE {} SET mtime = ? WHERE path = ?'.format(DEPEND_DB_PBSFILE_TABLE), touched)
 
 
 def get_deps_from_file(infile):
@@ -219,6 +349,37 @@ def get_deps_from_file(infile):
         raise KeyboardInterruptError()
 
 
+def get_deps_from_files(infiles):
+    ''' Display dependency of a lot of pbsfiles.
+
+    Pbsfiles are sourced by one 'dosource --batch' process.
+
+    Args:
+      infiles: list, paths to pbsfiles
+
+    Returns:
+      list: contains tuples like get_deps_from_file returns
+
+    '''
+    try:
+        pbsfiles = []
+        for infile in infiles:
+            pbsfile = ybs.utils.PbsFile()
+            pbsfile.parse(infile)
+            pbsfiles.append(pbsfile)
+        ybs.utils.pbs_cache.load_all(pbsfiles)
+        result = []
+        for pbsfile in pbsfiles:
+            result.append((pbsfile.name, pbsfile.version,
+                           ' '.join(pbsfile.get('RDEPEND')),
+                           ' '.join(pbsfile.get('BDEPEND')),
+                           ' '.join(pbsfile.get('RECOMMENDED')),
+                           ' '.join(pbsfile.get('CONFLICT'))))
+        return result
+    except KeyboardInterrupt:
+        raise KeyboardInterruptError()
+
+
 def get_deps_from_db(pkg, dep_type, dbfile=DEPEND_DB, dbtable=DEPEND_DB_TABLE):
     ''' Get run-time dependency from dbfile
 
@@ -233,16 +394,55 @@ def get_deps_from_db(pkg, dep_type, dbfile=DEPEND_DB, dbtable=DEPEND_DB_TABLE):
     '''
     conn = sqlite3.connect(dbfile)
     cur = conn.cursor()
-    cur.execute("SELECT {} FROM {} WHERE name = '{}'".format(dep_type, dbtable, pkg))
-    results = cur.fetchone()
+    # Got one row with NULL dep if pkg has no dependency, no row if pkg
+    # is not found
+    cur.execute("SELECT e.dep FROM {} u LEFT JOIN {} e ON e.pkg = u.name AND e.type = ? "
+                "WHERE u.name = ? ORDER BY e.rowid".format(dbtable, DEPEND_DB_EDGES_TABLE), (dep_type, pkg))
+    results = cur.fetchall()
+    cur.close()
+    conn.close()
     if results:
-        for res in [x.split('(')[0] for x in results[0].split()]:
-            yield res
+        for res in results:
+            if res[0] is not None:
+                yield res[0]
     else:
         sys.stderr.write("'{}' not found in {}, run 'pybs --update_db' and retry.\n".format(pkg, dbfile))
         sys.exit(1)
-    cur.close()
-    conn.close()
+
+
+def parse_pbsfiles(files, processes_num=PROCESSES_NUM):
+    ''' Parse dependency of pbsfiles with muti-processings
+
+    Args:
+      files: list, paths to pbsfiles
+      processes_num: int, numbers of muti-processings
+
+    Returns:
+      list: contains tuples (path, deps), deps looks like
+        get_deps_from_file returns
+
+    '''
+    if not files:
+        return []
+    processes_num = min(processes_num, len(files))
+    # One long-lived 'dosource --batch' process per worker
+    chunks = [files[i::processes_num] for i in range(processes_num)]
+    if processes_num == 1:
+        return zip(files, get_deps_from_files(files))
+    pool = multiprocessing.Pool(processes_num)
+    result = []
+    try:
+        result = [x for chunk in pool.map(get_deps_from_files, chunks) for x in chunk]
+        pool.close()
+    except KeyboardInterrupt:
+        print 'Got ^C while pool mapping, terminate the pool'
+        pool.terminate()
+    finally:
+        pool.join()
+    if len(result) != len(files):
+        sys.stderr.write('Missing datas: found {}, handled {}\n'.format(len(files), len(result)))
+        sys.exit(1)
+    return zip([f for chunk in chunks for f in chunk], result)
 
 
 def ybs_init_db(dbfile=DEPEND_DB, dbtable=DEPEND_DB_TABLE, processes_num=PROCESSES_NUM):
@@ -254,31 +454,23 @@ def ybs_init_db(dbfile=DEPEND_DB, dbtable=DEPEND_DB_TABLE, processes_num=PROCESS
 
     '''
     if os.path.exists(dbfile):
-        return 0
+        if is_db_current(dbfile):
+            return 0
+        # Created by old version of pybs
+        os.remove(dbfile)
     dir_ = os.path.dirname(dbfile)
     if not os.path.isdir(dir_):
         os.mkdir(dir_)
     sys.stderr.write("Parsing dependency tree of '{}' to '{}'...\n".format(PBSLIB_PATH, dbfile))
     # Creat memory type database
     conn = sqlite3.connect(':memory:')
-    conn.execute("CREATE TABLE IF NOT EXISTS {} (name TEXT, version TEXT, rdep TEXT, bdep TEXT, redep TEXT, cdep TEXT);".format(dbtable))
+    _create_tables(conn, dbtable)
 
     files = ybs.utils.pkgs_in_dir(PBSLIB_PATH, '.pbs', filter_by='version')
-    pool = multiprocessing.Pool(processes_num)
-    try:
-        result = pool.map(get_deps_from_file, files)
-        pool.close()
-    except KeyboardInterrupt:
-        print 'Got ^C while pool mapping, terminate the pool'
-        pool.terminate()
-    finally:
-        pool.join()
-    if len(result) != len(files):
-        sys.stderr.write('Missing datas: found {}, handled {}\n'.format(len(files), len(result)))
-        sys.exit(1)
+    result = parse_pbsfiles(files, processes_num)
     # Write to memory type database
-    for res in result:
-        conn.execute('INSERT INTO {} (name, version, rdep, bdep, redep, cdep) VALUES (?, ?, ?, ?, ?, ?)'.format(dbtable), res)
+    for path, res in result:
+        _insert_deps(conn, dbtable, path, res)
     # Write data of RAM to file
     str_buffer = StringIO.StringIO()
     for line in conn.iterdump():
@@ -306,6 +498,239 @@ def ybs_compare_version(s1, s2):
     return (ybs.utils.compare_version(v1, v2))
 
 
+class DepGraph(object):
+    ''' dependency graph of pbslib, loaded from dbfile once
+
+    Attributes:
+      dep_type: string, type of dependency, such as: rdep, bdep
+      deps: dict mapping, keys are package names, values are lists of
+        dependency names in the order of pbsfile
+
+    Methods:
+      closure: get packages required by packages recursively
+      build_order: sort closure, dependency goes before its dependents
+      cycles: find circular dependency in packages
+      reduce: drop packages required by other ones in packages
+
+    To Use:
+      >>> import ybs.pybs
+      >>> graph = ybs.pybs.DepGraph('rdep')
+      >>> graph.closure(['leafpad'])
+      ['leafpad', 'gtk2', 'glibc', ...]
+      >>> graph.build_order(['leafpad'])
+      [..., 'glibc', 'gtk2', 'leafpad']
+
+    '''
+    def __init__(self, dep_type, dbfile=DEPEND_DB, dbtable=DEPEND_DB_TABLE):
+        self.dep_type = dep_type
+        self.dbfile = dbfile
+        self.deps = {}
+        conn = sqlite3.connect(dbfile)
+        for (name,) in conn.execute("SELECT name FROM {}".format(dbtable)):
+            self.deps[name] = []
+        for pkg, dep in conn.execute("SELECT pkg, dep FROM {} WHERE type = ? ORDER BY rowid".format(DEPEND_DB_EDGES_TABLE),
+                                     (dep_type,)):
+            deps = self.deps.setdefault(pkg, [])
+            # Skip duplicate items and package itself
+            if dep != pkg and dep not in deps:
+                deps.append(dep)
+        conn.close()
+
+    def __repr__(self):
+        return "class '{}' for '{}' dependency graph".format(self.__class__.__name__, self.dep_type)
+
+    __str__ = __repr__
+
+    def closure(self, pkgs):
+        ''' get packages required by packages recursively
+
+        Args:
+          pkgs: list, names of package
+
+        Returns:
+          list: contains pkgs and all of their dependency, in breadth
+            first order
+
+        '''
+        seen = set(pkgs)
+        result = list(pkgs)
+        queue = collections.deque(pkgs)
+        while queue:
+            pkg = queue.popleft()
+            if pkg not in self.deps:
+                sys.stderr.write("'{}' not found in {}, run 'pybs --update_db' and retry.\n".format(pkg, self.dbfile))
+                sys.exit(1)
+            for dep in self.deps[pkg]:
+                if dep not in seen:
+                    seen.add(dep)
+                    result.append(dep)
+                    queue.append(dep)
+        return result
+
+    def build_order(self, pkgs):
+        ''' sort closure of packages, dependency goes before its dependents
+
+        Circular dependency is reported and exit, instead of producing an
+        arbitrary order.
+
+        Args:
+          pkgs: list, names of package
+
+        Returns:
+          list: contains string items
+
+        '''
+        nodes = self.closure(pkgs)
+        # Kahn's algorithm, count of unbuilt dependency for each package
+        pending = {}
+        dependents = {}
+        for pkg in nodes:
+            pending[pkg] = len(self.deps[pkg])
+            for dep in self.deps[pkg]:
+                dependents.setdefault(dep, []).append(pkg)
+        queue = collections.deque(x for x in nodes if not pending[x])
+        order = []
+        while queue:
+            pkg = queue.popleft()
+            order.append(pkg)
+            for x in dependents.get(pkg, []):
+                pending[x] -= 1
+                if not pending[x]:
+                    queue.append(x)
+        if len(order) != len(nodes):
+            sys.stderr.write('Circular dependency found:\n')
+            for cycle in self.cycles([x for x in nodes if pending[x]]):
+                sys.stderr.write('  {}\n'.format(' -> '.join(cycle + cycle[0:1])))
+            sys.exit(1)
+        return order
+
+    def cycles(self, pkgs):
+        ''' find circular dependency in packages
+
+        Args:
+          pkgs: list, names of package, such as those left by Kahn's
+            algorithm
+
+        Returns:
+          list: contains cycles, each one is a list of package names
+
+        '''
+        members = set(pkgs)
+        done = set()
+        result = []
+        for start in pkgs:
+            if start in done:
+                continue
+            # Walk along dependency inside members until a package is
+            # visited again, every member has such a dependency
+            path = []
+            index = {}
+            pkg = start
+            while pkg not in index and pkg not in done:
+                index[pkg] = len(path)
+                path.append(pkg)
+                pkg = [x for x in self.deps[pkg] if x in members][0]
+            if pkg in index:
+                result.append(path[index[pkg]:])
+            done.update(path)
+        return result
+
+    def reach_masks(self, pkgs):
+        ''' get packages reachable from every package, as bitsets of pkgs
+
+        Strongly connected components are found by Tarjan's algorithm,
+        bitset of a component is computed once from its dependency,
+        which are always finished before it.
+
+        Args:
+          pkgs: list, names of package, the n-th one is bit 1 << n
+
+        Returns:
+          dict mapping, keys are names of packages reachable from pkgs,
+          values are bitsets of pkgs reachable through one dependency at
+          least
+
+        '''
+        bits = dict((pkg, 1 << num) for num, pkg in enumerate(pkgs))
+        masks = {}
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        for root in pkgs:
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.deps.get(root, [])))]
+            while work:
+                pkg, deps = work[-1]
+                for dep in deps:
+                    if dep not in index:
+                        index[dep] = low[dep] = len(index)
+                        stack.append(dep)
+                        on_stack.add(dep)
+                        work.append((dep, iter(self.deps.get(dep, []))))
+                        break
+                    elif dep in on_stack:
+                        low[pkg] = min(low[pkg], index[dep])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[pkg])
+                    if low[pkg] != index[pkg]:
+                        continue
+                    component = []
+                    while True:
+                        x = stack.pop()
+                        on_stack.discard(x)
+                        component.append(x)
+                        if x == pkg:
+                            break
+                    members = set(component)
+                    mask = 0
+                    # Members of a cycle reach each other
+                    if len(component) > 1:
+                        for x in component:
+                            mask |= bits.get(x, 0)
+                    for x in component:
+                        for dep in self.deps.get(x, []):
+                            if dep not in members:
+                                mask |= masks[dep] | bits.get(dep, 0)
+                    for x in component:
+                        masks[x] = mask
+        return masks
+
+    def reduce(self, pkgs):
+        ''' transitive reduction, drop packages required by other ones
+
+        Of packages requiring each other, the first one is kept.
+
+        Args:
+          pkgs: list, names of package
+
+        Returns:
+          list: pkgs not reachable from other ones, in the order of pkgs
+
+        '''
+        seen = set()
+        pkgs = [x for x in pkgs if not (x in seen or seen.add(x))]
+        masks = self.reach_masks(pkgs)
+        result = []
+        for num, pkg in enumerate(pkgs):
+            bit = 1 << num
+            for other_num, other in enumerate(pkgs):
+                if other_num == num or not masks[other] & bit:
+                    continue
+                if other_num < num or not masks[pkg] & (1 << other_num):
+                    break
+            else:
+                result.append(pkg)
+        return result
+
+
 def get_deps_from_db_deep(pkg, dep_type, dbfile=DEPEND_DB, dbtable=DEPEND_DB_TABLE):
     ''' Get build-time dependency from dbfile
 
@@ -315,51 +740,39 @@ def get_deps_from_db_deep(pkg, dep_type, dbfile=DEPEND_DB, dbtable=DEPEND_DB_TAB
       dbfile: dbfile
 
     Returns:
-      list: contains string items
+      list: contains string items, in build order
 
     '''
-    conn = sqlite3.connect(dbfile)
-    cur = conn.cursor()
+    return DepGraph(dep_type, dbfile, dbtable).build_order([pkg])
 
-    def _do_get(inlist):
-        result = []
-        for pkg in inlist:
-            cur.execute("SELECT {} FROM {} WHERE name = '{}'".format(dep_type, dbtable, pkg))
-            pkg_rdep = cur.fetchone()
-            # (u'ca-certificates libssh(>=0.2) openssl zlib rtmpdump',)
-            if not pkg_rdep:
-                sys.stderr.write("'{}' not found in {}, run 'pybs --update_db' and retry.\n".format(pkg, dbfile))
-                sys.exit(1)
-            pkg_rdep = [x.split('(')[0] for x in pkg_rdep[0].split()]
-            #result.extend(pkg_rdep)
-            for x in pkg_rdep:
-                if x not in result:
-                    result.append(x)
-        return result
 
-    record = [pkg]
-    while True:
-        pre = len(record)
-        for x in _do_get(record):
-            if x not in record:
-                record.append(x)
-        if len(record) == pre:
-            break
-
-    order = []
-    for x in record:
-        #print x
-        for y in order:
-            if x in _do_get([y]):
-                order.insert(order.index(y), x)
-                break
-        if x not in order:
-            order.append(x)
-        #print order
+def ybs_build_graph(pkgs, dbfile=DEPEND_DB, dbtable=DEPEND_DB_TABLE):
+    ''' Display build-time dependency among packages to build
 
-    cur.close()
-    conn.close()
-    return order
+    Each line looks like 'pkg: dep1 dep2', dep is one of pkgs which pkg
+    requires directly, or through packages not in pkgs. Used by the
+    parallel scheduler of 'ybs -i'.
+
+    Args:
+      pkgs: list, names of package to build
+
+    '''
+    graph = DepGraph('bdep', dbfile, dbtable)
+    members = set(pkgs)
+    for pkg in pkgs:
+        deps = []
+        seen = set([pkg])
+        queue = collections.deque(graph.deps.get(pkg, []))
+        while queue:
+            x = queue.popleft()
+            if x in seen:
+                continue
+            seen.add(x)
+            if x in members:
+                deps.append(x)
+            else:
+                queue.extend(graph.deps.get(x, []))
+        print('{}: {}'.format(pkg, ' '.join(deps)))
 
 
 def ybs_pretend(pkg, pbslib):
@@ -421,6 +834,8 @@ def main():
                         dest='s', help='search package in pbslib')
     parser.add_argument('-p', '--pretend', nargs='+', metavar='pkg',
                         dest='p', help='instead of actually build, display what to do')
+    parser.add_argument('-bg', '--build_graph', nargs='+', metavar='pkg',
+                        dest='bg', help='show build-time dependency among packages to build')
     parser.add_argument('-w', '--showpbs', nargs='+', metavar='pkg',
                         dest='w', help='show available pbsfile in pbsdir')
     parser.add_argument('-gr', '--get_rdeps', nargs='+', metavar='pkg',
@@ -435,6 +850,8 @@ def main():
                         dest='wr', help='show what require given package')
     parser.add_argument('-u', '--update_db', action='store_true',
                         dest='u', help='update dependency database')
+    parser.add_argument('-U', '--rebuild_db', action='store_true',
+                        dest='U', help='rebuild dependency database from scratch')
     parser.add_argument('-cv', '--compare_version', nargs=2, metavar='ver',
                         dest='cv', help='comprare two version strings')
     args = parser.parse_args(argvs)
@@ -459,8 +876,8 @@ def main():
         global SHOW_UNINSTALLED_ONLY
         SHOW_UNINSTALLED_ONLY = True
 
-    if args.u:
-        ybs_update_db()
+    if args.u or args.U:
+        ybs_update_db(rebuild=args.U)
 
     if args.l:
         pbslib_map = ybs.utils.parse_pbslib(PBSLIB_PATH)
@@ -489,6 +906,10 @@ def main():
         for pkg in args.p:
             ybs_pretend(pkg, pbslib_map)
 
+    if args.bg:
+        ybs_init_db()
+        ybs_build_graph(args.bg)
+
     if args.t:
         for pkg in args.t:
             ybs_status(pkg)
@@ -8,8 +8,16 @@
 __version__ = '3.0'
 __package_db__ = '/var/ypkg/db/package.db'
 __package_db_table__ = 'world'
+__package_db_file_table__ = 'world_file'
 __depend_db__ = '/var/ybs/db/depend.db'
 __depend_db_table__ = 'universe'
+__depend_db_pbsfile_table__ = 'pbsfile'
+__depend_db_edges_table__ = 'edges'
+__pbslib_index__ = '/var/ybs/db/pbslib.idx'
+__pbs_cache_db__ = '/var/ybs/db/pbsfile.db'
+__pbs_cache_db_table__ = 'pbsfile'
+__checksum_cache_db__ = '/var/ybs/db/checksum.db'
+__checksum_cache_db_table__ = 'checksum'
 __ybs_conf__ = '/etc/ybs.conf'
 
 
@@ -11,8 +11,24 @@ import sqlite3
 import subprocess
 from distutils.version import LooseVersion
 import time
-from hashlib import sha1, md5
+import threading
+import collections
+import cPickle
+import tempfile
+import hashlib
+import stat
+import struct
+import re
+from multiprocessing.pool import ThreadPool
 from . import settings
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # Backport for python2, https://pypi.python.org/pypi/scandir
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 
 def is_empty_dir(indir):
@@ -25,9 +41,8 @@ def is_empty_dir(indir):
       boolean value, True or False
 
     '''
-    for root, dirs, files in os.walk(indir):
-        if files:
-            return False
+    for _ in scan_dir(indir, type_=None):
+        return False
     return True
 
 
@@ -81,6 +96,83 @@ def what_time(value=None):
     return time.strftime('%Y-%m-%d,%H:%M:%S', time.localtime(value))
 
 
+# Size of chunk read from file by get_checksums
+CHECKSUM_BUFSIZE = 1024 * 1024
+# One chunk buffer per thread, get_checksums runs in threads of get_checksums_batch
+_checksum_local = threading.local()
+
+
+def get_checksums(infile, tools=('sha1',), bufsize=CHECKSUM_BUFSIZE):
+    ''' get several checksums of file in one pass
+
+    File is read in chunks into a buffer kept per thread, so memory used
+    does not depend on size or numbers of files.
+
+    Args:
+      infile: string, path to file
+      tools: tuple, names of algorithm, such as 'md5', 'sha1', 'sha256'
+      bufsize: integer, size of chunk
+
+    Return:
+      None if infile can not be read, or dict mapping, keys are names of
+      algorithm, values are strings of checksum value
+
+    To use:
+      >>> import ybs.utils
+      >>> ybs.utils.get_checksums('/tmp/test', ('md5', 'sha1'))
+      {'sha1': 'da39a3ee5e6b4b0d3255bfef95601890afd80709', 'md5': 'd41d8cd98f00b204e9800998ecf8427e'}
+
+    '''
+    hashes = [(tool, hashlib.new(tool)) for tool in tools]
+    buf = getattr(_checksum_local, 'buf', None)
+    if buf is None or len(buf) != bufsize:
+        buf = _checksum_local.buf = bytearray(bufsize)
+    view = memoryview(buf)
+    try:
+        with open(infile, 'rb') as fd:
+            while True:
+                size = fd.readinto(buf)
+                if not size:
+                    break
+                for _, hash_ in hashes:
+                    hash_.update(view[:size])
+    except IOError:
+        return None
+    return dict((tool, hash_.hexdigest()) for tool, hash_ in hashes)
+
+
+def get_checksums_batch(infiles, tools=('sha1',), threads=4):
+    ''' get checksums of a lot of files with a thread pool
+
+    hashlib releases the GIL while hashing, so reading and hashing of
+    files overlap.
+
+    Args:
+      infiles: iterator, paths to files
+      tools: tuple, names of algorithm, such as 'md5', 'sha1', 'sha256'
+      threads: integer, numbers of threads
+
+    Returns:
+      yield generator, contains tuples (infile, checksums), checksums
+      looks like get_checksums returns, in the order of infiles
+
+    To use:
+      >>> import ybs.utils
+      >>> for f, sums in ybs.utils.get_checksums_batch(['/tmp/a', '/tmp/b'], ('md5',)):
+      ...     print f, sums['md5']
+      /tmp/a d41d8cd98f00b204e9800998ecf8427e
+      /tmp/b d41d8cd98f00b204e9800998ecf8427e
+
+    '''
+    pool = ThreadPool(threads)
+    try:
+        for result in pool.imap(lambda x: (x, get_checksums(x, tools)), infiles):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
 def get_checksum(infile, tool):
     ''' get checksum of file
 
@@ -98,18 +190,9 @@ def get_checksum(infile, tool):
       >>> ybs.utils.get_checksum('/tmp/test','md5')
       'd41d8cd98f00b204e9800998ecf8427e'
     '''
-    try:
-        with open(infile, 'rb') as fd:
-            if tool == 'sha1':
-                sha1sum = sha1()
-                sha1sum.update(fd.read())
-                return sha1sum.hexdigest()
-            if tool == 'md5':
-                md5sum = md5()
-                md5sum.update(fd.read())
-                return md5sum.hexdigest()
-    except IOError:
-        pass
+    checksums = get_checksums(infile, (tool,))
+    if checksums is not None:
+        return checksums[tool]
 
 
 def get_sha1sum(infile):
@@ -148,6 +231,591 @@ def get_md5sum(infile):
     return get_checksum(infile, 'md5')
 
 
+class _SqliteCache(object):
+    ''' base class of caches saved in sqlite3 database
+
+    If dbfile can not be written (e.g. not running as root), _connect()
+    returns None and subclasses work without persistent cache. With
+    readonly, dbfile must exist, it is neither created nor modified.
+
+    '''
+    # Statement creating dbtable, formatted with name of dbtable
+    schema = ''
+    readonly = False
+
+    def __init__(self, dbfile, dbtable):
+        self.dbfile = dbfile
+        self.dbtable = dbtable
+        self.conn = None
+        self.pid = None
+
+    def _connect(self):
+        # Connection of sqlite3 can not be shared with processes forked
+        # by multiprocessing, so reconnect in every process.
+        if self.pid == os.getpid():
+            return self.conn
+        self.pid = os.getpid()
+        self.conn = None
+        try:
+            if self.readonly:
+                # sqlite3.connect() creates missing file
+                if not os.path.isfile(self.dbfile):
+                    return None
+                conn = sqlite3.connect(self.dbfile, timeout=30)
+                conn.text_factory = str
+                conn.execute("PRAGMA query_only = ON")
+                self.conn = conn
+                return self.conn
+            dir_ = os.path.dirname(self.dbfile)
+            if not os.path.isdir(dir_):
+                os.makedirs(dir_)
+            conn = sqlite3.connect(self.dbfile, timeout=30)
+            conn.text_factory = str
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute(self.schema.format(self.dbtable))
+            conn.commit()
+            self.conn = conn
+        except (OSError, sqlite3.Error):
+            pass
+        return self.conn
+
+
+def _stat_key(st):
+    ''' (dev, inode, size, mtime_ns) of os.stat result '''
+    mtime_ns = getattr(st, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        # python2 has float st_mtime only
+        mtime_ns = int(st.st_mtime * 1000000000)
+    return (st.st_dev, st.st_ino, st.st_size, mtime_ns)
+
+
+class ChecksumCache(_SqliteCache):
+    ''' persistent cache of checksums of files
+
+    Checksums are saved by path together with (dev, inode, size, mtime_ns)
+    of file, and returned only while those are unchanged. Only new or
+    modified files are read and hashed.
+
+    Attributes:
+      dbfile: string, path to cache database
+      dbtable: string, table of cache database
+
+    Methods:
+      get: get checksums of file
+      get_batch: get checksums of a lot of files
+
+    To Use:
+      >>> import ybs.utils
+      >>> ybs.utils.checksum_cache.get('/tmp/test', ('sha1',))
+      {'sha1': 'da39a3ee5e6b4b0d3255bfef95601890afd80709'}
+
+    '''
+    schema = ("CREATE TABLE IF NOT EXISTS {} (path TEXT, tool TEXT, dev INTEGER, inode INTEGER, "
+              "size INTEGER, mtime INTEGER, checksum TEXT, PRIMARY KEY (path, tool));")
+
+    def __init__(self, dbfile=settings.__checksum_cache_db__, dbtable=settings.__checksum_cache_db_table__):
+        _SqliteCache.__init__(self, dbfile, dbtable)
+
+    def __repr__(self):
+        return "class '{}' for caching checksums of files".format(self.__class__.__name__)
+
+    __str__ = __repr__
+
+    def _lookup(self, conn, path, key, tools):
+        res = conn.execute("SELECT tool, checksum FROM {} WHERE path = ? AND dev = ? AND inode = ? "
+                           "AND size = ? AND mtime = ?".format(self.dbtable), (path,) + key).fetchall()
+        checksums = dict(x for x in res if x[0] in tools)
+        if len(checksums) == len(tools):
+            return checksums
+
+    def _store(self, conn, path, key, checksums):
+        conn.executemany("INSERT OR REPLACE INTO {} (path, tool, dev, inode, size, mtime, checksum) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)".format(self.dbtable),
+                         [(path, tool) + key + (checksum,) for tool, checksum in checksums.iteritems()])
+
+    def get(self, infile, tools=('sha1',)):
+        ''' get checksums of file
+
+        Args:
+          infile: string, path to file
+          tools: tuple, names of algorithm, such as 'md5', 'sha1', 'sha256'
+
+        Returns:
+          None or dict mapping like get_checksums returns
+
+        '''
+        return self.get_batch([infile], tools, threads=1)[0][1]
+
+    def get_batch(self, infiles, tools=('sha1',), threads=4):
+        ''' get checksums of a lot of files
+
+        Files missing from cache are hashed by get_checksums_batch, then
+        saved in one transaction.
+
+        Args:
+          infiles: list, paths to files
+          tools: tuple, names of algorithm, such as 'md5', 'sha1', 'sha256'
+          threads: integer, numbers of threads
+
+        Returns:
+          list: contains tuples (infile, checksums), in the order of infiles
+
+        '''
+        conn = self._connect()
+        result = {}
+        keys = {}
+        misses = []
+        for infile in infiles:
+            try:
+                key = _stat_key(os.stat(infile))
+            except OSError:
+                result[infile] = None
+                continue
+            path = os.path.abspath(infile)
+            checksums = None
+            if conn is not None:
+                try:
+                    checksums = self._lookup(conn, path, key, tools)
+                except sqlite3.Error:
+                    pass
+            if checksums is None:
+                keys[infile] = (path, key)
+                misses.append(infile)
+            else:
+                result[infile] = checksums
+        if len(misses) > 1:
+            hashed = get_checksums_batch(misses, tools, threads)
+        else:
+            hashed = [(x, get_checksums(x, tools)) for x in misses]
+        for infile, checksums in hashed:
+            result[infile] = checksums
+        if conn is not None and misses:
+            try:
+                for infile in misses:
+                    path, key = keys[infile]
+                    # Skip files modified while hashing
+                    if result[infile] is None or _stat_key(os.stat(infile)) != key:
+                        continue
+                    self._store(conn, path, key, result[infile])
+                conn.commit()
+            except (OSError, sqlite3.Error):
+                pass
+        return [(x, result[x]) for x in infiles]
+
+checksum_cache = ChecksumCache()
+
+
+# Categories of files, the same as ybs-scanrdeps used to get by 'file -b'
+FILE_TYPE_BIN = 'bin'
+FILE_TYPE_PYTHON = 'python'
+FILE_TYPE_PERL = 'perl'
+FILE_TYPE_PERL5MODULE = 'perl5module'
+FILE_TYPE_SHELL = 'shell'
+FILE_TYPE_TCL = 'tcl'
+FILE_TYPE_BUFSIZE = 512
+
+_INTERPRETERS = (
+    (('python',), FILE_TYPE_PYTHON),
+    (('perl',), FILE_TYPE_PERL),
+    (('sh', 'bash', 'dash', 'ash', 'ksh', 'mksh', 'zsh', 'csh', 'tcsh'), FILE_TYPE_SHELL),
+    (('tclsh', 'wish', 'expect'), FILE_TYPE_TCL),
+    )
+
+
+def _interpreter_type(line):
+    ''' get category by shebang line, such as '#!/usr/bin/env python2.7' '''
+    args = line[2:].split()
+    if not args:
+        return None
+    prog = os.path.basename(args[0])
+    if prog == 'env' and len(args) > 1:
+        prog = os.path.basename(args[1])
+    # Strip version, such as 'python2.7', 'tclsh8.6', 'perl5.36-x86_64-linux-gnu'
+    prog = re.match(r'[A-Za-z]*', prog).group()
+    for progs, type_ in _INTERPRETERS:
+        if prog in progs:
+            return type_
+    return None
+
+
+def get_file_type(infile, bufsize=FILE_TYPE_BUFSIZE):
+    ''' get category of file by reading its header only
+
+    ELF executables and shared objects are detected from e_type of ELF
+    header, scripts from shebang. Symlinks and special files are not
+    regular files, None is returned like 'file -b' reports nothing.
+
+    Args:
+      infile: string, path to file
+      bufsize: integer, bytes to read
+
+    Returns:
+      None or string, one of FILE_TYPE_BIN, FILE_TYPE_PYTHON,
+      FILE_TYPE_PERL, FILE_TYPE_PERL5MODULE, FILE_TYPE_SHELL,
+      FILE_TYPE_TCL
+
+    To use:
+      >>> import ybs.utils
+      >>> ybs.utils.get_file_type('/bin/ls')
+      'bin'
+      >>> ybs.utils.get_file_type('/usr/bin/ldd')
+      'shell'
+
+    '''
+    try:
+        if not stat.S_ISREG(os.lstat(infile).st_mode):
+            return None
+        with open(infile, 'rb') as f:
+            head = f.read(bufsize)
+    except (IOError, OSError):
+        return None
+    if head.startswith('\x7fELF'):
+        if len(head) < 18:
+            return None
+        # EI_DATA, 1 is little endian, 2 is big endian
+        e_type = struct.unpack('<H' if head[5] == '\x01' else '>H', head[16:18])[0]
+        # ET_EXEC, ET_DYN
+        if e_type in (2, 3):
+            return FILE_TYPE_BIN
+        return None
+    if head.startswith('#!'):
+        return _interpreter_type(head.split('\n', 1)[0])
+    if infile.endswith('.pm'):
+        for line in head.splitlines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('package ') and ';' in line:
+                return FILE_TYPE_PERL5MODULE
+            break
+    return None
+
+
+def get_file_types(infiles, threads=4):
+    ''' get categories of a lot of files with a thread pool
+
+    Args:
+      infiles: iterator, paths to files
+      threads: integer, numbers of threads
+
+    Returns:
+      yield generator, contains tuples (infile, type), type looks like
+      get_file_type returns, in the order of infiles
+
+    To use:
+      >>> import ybs.utils
+      >>> for f, type_ in ybs.utils.get_file_types(['/bin/ls', '/usr/bin/ldd']):
+      ...     print f, type_
+      /bin/ls bin
+      /usr/bin/ldd shell
+
+    '''
+    pool = ThreadPool(threads)
+    try:
+        for result in pool.imap(lambda x: (x, get_file_type(x)), infiles):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+# ELF constants used by soname resolving
+_PT_LOAD = 1
+_PT_DYNAMIC = 2
+_DT_NULL = 0
+_DT_NEEDED = 1
+_DT_STRTAB = 5
+_DT_STRSZ = 10
+_DT_RPATH = 15
+_DT_RUNPATH = 29
+
+LD_SO_CACHE = '/etc/ld.so.cache'
+
+# elfclass: 1 is 32-bit, 2 is 64-bit, needed/rpath/runpath are lists
+ElfInfo = collections.namedtuple('ElfInfo', 'elfclass machine needed rpath runpath')
+
+
+def read_elf_dynamic(infile):
+    ''' read DT_NEEDED, DT_RPATH and DT_RUNPATH from dynamic section of ELF
+
+    Args:
+      infile: string, path to ELF file
+
+    Returns:
+      None if infile is not ELF file, or ElfInfo
+
+    To use:
+      >>> import ybs.utils
+      >>> ybs.utils.read_elf_dynamic('/bin/ls').needed
+      ['libacl.so.1', 'libc.so.6']
+
+    '''
+    try:
+        with open(infile, 'rb') as f:
+            ident = f.read(64)
+            if len(ident) < 52 or not ident.startswith('\x7fELF'):
+                return None
+            elfclass = ord(ident[4])
+            end = '<' if ident[5] == '\x01' else '>'
+            machine = struct.unpack(end + 'H', ident[18:20])[0]
+            if elfclass == 2:
+                phoff, = struct.unpack(end + 'Q', ident[32:40])
+                phentsize, phnum = struct.unpack(end + 'HH', ident[54:58])
+                phdr_fmt, dyn_fmt = end + 'IIQQQQQQ', end + 'qQ'
+            else:
+                phoff, = struct.unpack(end + 'I', ident[28:32])
+                phentsize, phnum = struct.unpack(end + 'HH', ident[42:46])
+                phdr_fmt, dyn_fmt = end + 'IIIIIIII', end + 'iI'
+            f.seek(phoff)
+            data = f.read(phentsize * phnum)
+            loads = []
+            dynamic = None
+            size = struct.calcsize(phdr_fmt)
+            for num in range(phnum):
+                phdr = struct.unpack(phdr_fmt, data[num * phentsize:num * phentsize + size])
+                if elfclass == 2:
+                    p_type, p_offset, p_vaddr, p_filesz = phdr[0], phdr[2], phdr[3], phdr[5]
+                else:
+                    p_type, p_offset, p_vaddr, p_filesz = phdr[0], phdr[1], phdr[2], phdr[4]
+                if p_type == _PT_LOAD:
+                    loads.append((p_vaddr, p_offset, p_filesz))
+                elif p_type == _PT_DYNAMIC:
+                    dynamic = (p_offset, p_filesz)
+            if dynamic is None:
+                # Static linked
+                return ElfInfo(elfclass, machine, [], [], [])
+            f.seek(dynamic[0])
+            data = f.read(dynamic[1])
+            size = struct.calcsize(dyn_fmt)
+            entries = []
+            strtab = strsz = None
+            for num in range(len(data) // size):
+                d_tag, d_val = struct.unpack(dyn_fmt, data[num * size:(num + 1) * size])
+                if d_tag == _DT_NULL:
+                    break
+                elif d_tag == _DT_STRTAB:
+                    strtab = d_val
+                elif d_tag == _DT_STRSZ:
+                    strsz = d_val
+                elif d_tag in (_DT_NEEDED, _DT_RPATH, _DT_RUNPATH):
+                    entries.append((d_tag, d_val))
+            if strtab is None or strsz is None:
+                return ElfInfo(elfclass, machine, [], [], [])
+            # DT_STRTAB is an address, map it to offset of file
+            for vaddr, offset, filesz in loads:
+                if vaddr <= strtab < vaddr + filesz:
+                    strtab = strtab - vaddr + offset
+                    break
+            f.seek(strtab)
+            strings = f.read(strsz)
+    except (IOError, OSError, struct.error):
+        return None
+    result = {_DT_NEEDED: [], _DT_RPATH: [], _DT_RUNPATH: []}
+    for d_tag, d_val in entries:
+        result[d_tag].append(strings[d_val:strings.find('\0', d_val)])
+    rpath = [x for y in result[_DT_RPATH] for x in y.split(':') if x]
+    runpath = [x for y in result[_DT_RUNPATH] for x in y.split(':') if x]
+    return ElfInfo(elfclass, machine, result[_DT_NEEDED], rpath, runpath)
+
+
+def parse_ld_so_cache(cachefile=LD_SO_CACHE):
+    ''' parse cache of ldconfig
+
+    Both format 'ld.so-1.7.0' and 'glibc-ld.so.cache1.1' are supported.
+
+    Args:
+      cachefile: string, path to ld.so.cache
+
+    Returns:
+      dict mapping, keys are sonames, values are lists of paths in the
+      order of cache
+
+    '''
+    result = collections.OrderedDict()
+    try:
+        with open(cachefile, 'rb') as f:
+            data = f.read()
+    except IOError:
+        return result
+    old_magic = 'ld.so-1.7.0'
+    new_magic = 'glibc-ld.so.cache1.1'
+    entries = []
+    if data.startswith(old_magic):
+        nlibs, = struct.unpack('<I', data[12:16])
+        start = 16 + nlibs * 12
+        # New format follows old one, aligned to 8 bytes
+        new = (start + 7) & ~7
+        if data[new:new + len(new_magic)] == new_magic:
+            data = data[new:]
+        else:
+            for num in range(nlibs):
+                entries.append(struct.unpack('<iII', data[16 + num * 12:28 + num * 12]))
+            strings = data[start:]
+    if data.startswith(new_magic):
+        nlibs, = struct.unpack('<I', data[20:24])
+        for num in range(nlibs):
+            entries.append(struct.unpack('<iII', data[48 + num * 24:60 + num * 24]))
+        strings = data
+    for flags, key, value in entries:
+        soname = strings[key:strings.find('\0', key)]
+        path = strings[value:strings.find('\0', value)]
+        result.setdefault(soname, []).append(path)
+    return result
+
+
+def _expand_dst(dirs, infile, elfclass):
+    ''' expand $ORIGIN and $LIB in DT_RPATH or DT_RUNPATH of infile '''
+    origin = os.path.dirname(os.path.abspath(infile))
+    lib = 'lib64' if elfclass == 2 else 'lib'
+    return tuple(x.replace('${ORIGIN}', origin).replace('$ORIGIN', origin)
+                 .replace('${LIB}', lib).replace('$LIB', lib) for x in dirs)
+
+
+class SonameResolver(object):
+    ''' resolve libraries required by ELF files without running ldd
+
+    Sonames are searched the way of dynamic linker: DT_RPATH,
+    LD_LIBRARY_PATH, DT_RUNPATH, ld.so.cache and default directories.
+    ELF headers and soname -> path mappings are memoized for the whole
+    run.
+
+    Methods:
+      needed: get libraries required by ELF file recursively
+
+    To use:
+      >>> import ybs.utils
+      >>> libs, missing = ybs.utils.soname_resolver.needed('/bin/ls')
+      >>> libs
+      ['/lib64/libacl.so.1.1.0', '/lib64/libc-2.17.so', '/lib64/libattr.so.1.1.0', '/lib64/ld-2.17.so']
+      >>> missing
+      []
+
+    '''
+    def __init__(self, cachefile=LD_SO_CACHE):
+        '''
+        Args:
+          cachefile: string, path to ld.so.cache
+
+        '''
+        self.cachefile = cachefile
+        self._ld_so_cache = None
+        self._elf = {}
+        self._found = {}
+
+    def ld_so_cache(self):
+        ''' parsed ld.so.cache, loaded once '''
+        if self._ld_so_cache is None:
+            self._ld_so_cache = parse_ld_so_cache(self.cachefile)
+        return self._ld_so_cache
+
+    def elf(self, infile):
+        ''' memoized read_elf_dynamic() '''
+        if infile not in self._elf:
+            self._elf[infile] = read_elf_dynamic(infile)
+        return self._elf[infile]
+
+    def _is_match(self, path, info):
+        ''' library is of the same class and machine as requester '''
+        lib = self.elf(path)
+        return lib is not None and (lib.elfclass, lib.machine) == (info.elfclass, info.machine)
+
+    def find(self, soname, info, dirs=(), root=None):
+        ''' get path to library of soname
+
+        Args:
+          soname: string, such as 'libc.so.6'
+          info: ElfInfo of requester
+          dirs: tuple, directories searched before ld.so.cache
+          root: string, path to PKGDIR, libraries in it are prefered
+
+        Returns:
+          None if not found, or string of path
+
+        '''
+        key = (soname, info.elfclass, info.machine, dirs, root)
+        if key in self._found:
+            return self._found[key]
+        if info.elfclass == 2:
+            defaults = ['/lib64', '/usr/lib64']
+        else:
+            defaults = ['/lib', '/usr/lib']
+        candidates = [os.path.join(x, soname) for x in dirs]
+        cached = self.ld_so_cache().get(soname, [])
+        if root is not None:
+            candidates.extend(root + x for x in cached)
+            candidates.extend(os.path.join(root + x, soname) for x in defaults)
+        candidates.extend(cached)
+        candidates.extend(os.path.join(x, soname) for x in defaults)
+        result = None
+        for path in candidates:
+            if os.path.isfile(path) and self._is_match(path, info):
+                result = path
+                break
+        self._found[key] = result
+        return result
+
+    def needed(self, infile, root=None):
+        ''' get libraries required by ELF file recursively
+
+        Args:
+          infile: string, path to ELF file
+          root: string, path to PKGDIR if infile is in it, libraries in
+            PKGDIR are prefered, '$ORIGIN' is expanded inside PKGDIR too
+
+        Returns:
+          tuple, (libs, missing), libs is a list of real paths to
+          libraries, missing is a list of sonames not found
+
+        '''
+        libs = []
+        missing = []
+        main = self.elf(infile)
+        if main is None:
+            return libs, missing
+        if root is not None:
+            root = os.path.realpath(root)
+        env = tuple(x for x in os.environ.get('LD_LIBRARY_PATH', '').split(':') if x)
+        # DT_RPATH of executable is searched for all libraries
+        main_rpath = ()
+        if not main.runpath:
+            main_rpath = _expand_dst(main.rpath, infile, main.elfclass)
+        seen = set([os.path.realpath(infile)])
+        loaded = {}
+        queue = collections.deque([(infile, main)])
+        while queue:
+            path, info = queue.popleft()
+            # DT_RPATH is ignored if DT_RUNPATH exists
+            dirs = ()
+            if not info.runpath:
+                if info is not main:
+                    dirs += _expand_dst(info.rpath, path, info.elfclass)
+                dirs += main_rpath
+            dirs += env + _expand_dst(info.runpath, path, info.elfclass)
+            for soname in info.needed:
+                if soname in loaded:
+                    # Loaded already, such as found by DT_RUNPATH of executable
+                    continue
+                if '/' in soname:
+                    found = soname if os.path.isfile(soname) else None
+                else:
+                    found = self.find(soname, info, dirs, root)
+                loaded[soname] = found
+                if found is None:
+                    missing.append(soname)
+                    continue
+                real = os.path.realpath(found)
+                if real in seen:
+                    continue
+                seen.add(real)
+                libs.append(real)
+                lib_info = self.elf(real)
+                if lib_info is not None:
+                    queue.append((found, lib_info))
+        return libs, missing
+
+soname_resolver = SonameResolver()
+
+
 def is_pbsfile_likes(infile):
     ''' check whether infile is a valid pbsfile-likes or not
 
@@ -174,9 +842,108 @@ def is_pbsfile_likes(infile):
     return True
 
 
+class InstalledSnapshot(object):
+    ''' snapshot of installed packages
+
+    The whole installed package table is read from dbfile with one query
+    on first use, then shared by every caller in the process.
+
+    Attributes:
+      dbfile: string, path to package.db which is created by ypkg
+      dbtable: string, installed package table of debfile
+
+    Methods:
+      get: get information of installed package
+      versions: get versions of all installed packages
+      reload: read dbfile again
+
+    To Use:
+      >>> import ybs.utils
+      >>> snapshot = ybs.utils.installed_snapshot()
+      >>> snapshot.get('firefox')
+      (u'firefox', u'19.0', u'stable', 1361523561)
+      >>> 'firefox' in snapshot
+      True
+
+    '''
+    def __init__(self, dbfile=settings.__package_db__, dbtable=settings.__package_db_table__):
+        self.dbfile = dbfile
+        self.dbtable = dbtable
+        self.pkgs = None
+
+    def __repr__(self):
+        return "class '{}' for installed packages of '{}'".format(self.__class__.__name__, self.dbfile)
+
+    __str__ = __repr__
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __len__(self):
+        self._load()
+        return len(self.pkgs)
+
+    def _load(self):
+        if self.pkgs is None:
+            self.reload()
+
+    def reload(self):
+        conn = sqlite3.connect(self.dbfile)
+        cur = conn.cursor()
+        cur.execute("SELECT name, version, repo, install_time FROM {}".format(self.dbtable))
+        self.pkgs = dict((res[0], res) for res in cur.fetchall())
+        cur.close()
+        conn.close()
+
+    def get(self, name):
+        ''' get information of installed package
+
+        Args:
+          name: string, package name
+
+        Returns:
+          None or tuple like installed_info returns
+
+        '''
+        self._load()
+        return self.pkgs.get(name)
+
+    def versions(self):
+        ''' get versions of all installed packages
+
+        Returns:
+          dict mapping, {pkg_name: pkg_version, ...}
+
+        '''
+        self._load()
+        return dict((name, res[1]) for name, res in self.pkgs.iteritems())
+
+_installed_snapshots = {}
+
+
+def installed_snapshot(dbfile=settings.__package_db__, dbtable=settings.__package_db_table__):
+    ''' get InstalledSnapshot of dbfile shared in the process
+
+    Args:
+      dbfile: string, path to package.db which is created by ypkg
+      dbtable: string, installed package table of debfile
+
+    Returns:
+      InstalledSnapshot object
+
+    '''
+    key = (dbfile, dbtable)
+    if key not in _installed_snapshots:
+        _installed_snapshots[key] = InstalledSnapshot(dbfile, dbtable)
+    return _installed_snapshots[key]
+
+
 def installed_info(name, dbfile=settings.__package_db__, dbtable=settings.__package_db_table__):
     ''' show information of installed package from dbfile
 
+    Looked up in the shared InstalledSnapshot, dbfile is read only once
+    per process.
+
     Args:
       name: string, package name
       dbfile: string, path to package.db which is created by ypkg
@@ -188,14 +955,146 @@ def installed_info(name, dbfile=settings.__package_db__, dbtable=settings.__pack
         (u'firefox', u'19.0', u'stable', 1361523561)
 
     '''
-    conn = sqlite3.connect(dbfile)
-    cur = conn.cursor()
-    cur.execute("SELECT name, version, repo, install_time FROM {} Where name='{}'".format(dbtable, name))
-    # Use fetchone here, because installed package name is just only one.
-    result = cur.fetchone()
-    cur.close()
-    conn.close()
-    return result
+    return installed_snapshot(dbfile, dbtable).get(name)
+
+
+class FileOwners(_SqliteCache):
+    ''' owners of installed files, looked up in file table of package.db
+
+    dbfile is opened once per process and is not modified. Owners are
+    queried in batches and memoized for the whole run.
+
+    Methods:
+      get: get owners of a lot of files
+
+    To use:
+      >>> import ybs.utils
+      >>> ybs.utils.file_owners.get(['/lib64/libc-2.17.so', '/tmp/foo'])
+      {'/lib64/libc-2.17.so': ['glibc'], '/tmp/foo': []}
+
+    '''
+    readonly = True
+    # Limit of host parameters of sqlite3 is 999
+    batch = 500
+
+    def __init__(self, dbfile=settings.__package_db__, dbtable=settings.__package_db_file_table__):
+        super(FileOwners, self).__init__(dbfile, dbtable)
+        self.owners = {}
+
+    def __repr__(self):
+        return "class '{}' for owners of files in '{}'".format(self.__class__.__name__, self.dbfile)
+
+    __str__ = __repr__
+
+    def get(self, infiles):
+        ''' get owners of files
+
+        Args:
+          infiles: iterator, absolute paths to files
+
+        Returns:
+          dict mapping, keys are paths, values are lists of package
+          names, empty list if file is not owned by any package
+
+        Raises:
+          sqlite3.Error if dbfile can not be read
+
+        '''
+        infiles = list(infiles)
+        misses = list(set(x for x in infiles if x not in self.owners))
+        if misses:
+            conn = self._connect()
+            if conn is None:
+                raise sqlite3.OperationalError("unable to open database file '{}'".format(self.dbfile))
+            for num in range(0, len(misses), self.batch):
+                chunk = misses[num:num + self.batch]
+                for file_ in chunk:
+                    self.owners[file_] = []
+                cur = conn.execute("SELECT DISTINCT name, file FROM {} WHERE file IN ({})".format(
+                    self.dbtable, ', '.join('?' * len(chunk))), chunk)
+                for name, file_ in cur:
+                    self.owners[file_].append(name)
+        return dict((x, self.owners[x]) for x in infiles)
+
+file_owners = FileOwners()
+
+
+def lru_cache(maxsize=65536):
+    ''' decorator, cache results of function with least-recently-used policy
+
+    Args:
+      maxsize: integer, max number of results cached
+
+    '''
+    def _decorator(func):
+        cache = collections.OrderedDict()
+
+        def _wrapper(*args):
+            try:
+                result = cache.pop(args)
+            except KeyError:
+                result = func(*args)
+                if len(cache) >= maxsize:
+                    cache.popitem(last=False)
+            cache[args] = result
+            return result
+        _wrapper.__name__ = func.__name__
+        _wrapper.__doc__ = func.__doc__
+        _wrapper.cache_clear = cache.clear
+        return _wrapper
+    return _decorator
+
+
+# Rel versions are padded with 'r0' to this length, so that keys of
+# two versions compare the same way as padding one to the length of
+# the other.
+VERSION_REL_WIDTH = 8
+
+
+def _version_parts(string):
+    ''' split version string to comparable parts like LooseVersion
+
+    numbers go before strings, the same as LooseVersion does in python2
+
+    '''
+    return tuple((0, x) if isinstance(x, int) else (1, x) for x in LooseVersion(string).version)
+
+
+@lru_cache()
+def version_key(version):
+    ''' convert version string to a key which sorts in version order
+
+    Major version is compared like LooseVersion, trailing zeros make no
+    difference. Rel versions are compared one by one, missing ones are
+    treated as 'r0'. human readable: alpha < beta < rc < r
+
+    Args:
+      version: string, such as '2.0', '2.0-rc1', '5.5.29-1-rc1'
+
+    Returns:
+      tuple, (major, rel)
+
+    To use:
+      >>> import ybs.utils
+      >>> sorted(['1', '1-rc1', '1-r1'], key=ybs.utils.version_key)
+      ['1-rc1', '1', '1-r1']
+      >>> ybs.utils.version_key('1.0') == ybs.utils.version_key('1')
+      True
+
+    '''
+    version = str(version.lower())
+    items = version.split('-')
+    major = list(_version_parts(items[0] + '.0'))
+    while major and major[-1] == (0, 0):
+        major.pop()
+    rel = []
+    for x in items[1:]:
+        x = x.replace('alpha', 'a').replace('beta', 'b').replace('rc', 'c')
+        rel.append(_version_parts(x))
+    r0 = _version_parts('r0')
+    while len(rel) < VERSION_REL_WIDTH:
+        rel.append(r0)
+    return (tuple(major), tuple(rel))
 
 
 def compare_version(v1, v2):
@@ -228,74 +1127,41 @@ def compare_version(v1, v2):
       '='
 
     '''
-    # Splite major and rel version
-    v1 = str(v1.lower())
-    v2 = str(v2.lower())
-    v1_major = v1.split('-')[0]
-    v1_rel = v1.split('-')[1:]
-    v2_major = v2.split('-')[0]
-    v2_rel = v2.split('-')[1:]
-
-    # First, compare major version
-    v1_major += '.0'
-    v2_major += '.0'
-    # Be sure compare two version with same length
-    v1_major_len = len(v1_major.split('.'))
-    v2_major_len = len(v2_major.split('.'))
-    more = v1_major_len - v2_major_len
-    if more > 0:
-        v2_major += '.0' * abs(more)
-    else:
-        v1_major += '.0' * abs(more)
-
-    _cmp = lambda x, y: LooseVersion(x).__cmp__(y)
-
-    ret = _cmp(v1_major, v2_major)
-    if ret != 0:
-        #return ret
-        if ret == 1:
-            return '>'
-        if ret == -1:
-            return '<'
-
-    # Second, compare rel version
-
-    def _replacement(inlist):
-        inlist = [x.replace('alpha', 'a') for x in inlist]
-        inlist = [x.replace('beta', 'b') for x in inlist]
-        inlist = [x.replace('rc', 'c') for x in inlist]
-        return inlist
-
-    # Note:
-    # rel version is a list
-    v1_rel = _replacement(v1_rel)
-    v2_rel = _replacement(v2_rel)
-
-    # Be sure compare two version with same length
-    v1_rel_len = len(v1_rel)
-    v2_rel_len = len(v2_rel)
-    more = v1_rel_len - v2_rel_len
-    absmore = abs(more)
-    if more > 0:
-        while absmore > 0:
-            v2_rel.append('r0')
-            absmore -= 1
-    else:
-        while absmore > 0:
-            v1_rel.append('r0')
-            absmore -= 1
-    for x, y in zip(v1_rel, v2_rel):
-        ret = _cmp(x, y)
-        if ret != 0:
-            #return ret
-            if ret == 1:
-                return '>'
-            if ret == -1:
-                return '<'
-    #return 0
+    k1 = version_key(v1)
+    k2 = version_key(v2)
+    if k1 < k2:
+        return '<'
+    if k1 > k2:
+        return '>'
     return '='
 
 
+def split_depend(atom):
+    ''' split dependency atom into name, operator and version
+
+    Args:
+      atom: string, such as 'libarchive(>=3.0.4)' or 'curl'
+
+    Returns:
+      tuple, (name, operator, version), operator and version are empty
+      strings if atom has no version
+
+    To use:
+      >>> import ybs.utils
+      >>> ybs.utils.split_depend('libarchive(>=3.0.4)')
+      ('libarchive', '>=', '3.0.4')
+      >>> ybs.utils.split_depend('curl')
+      ('curl', '', '')
+
+    '''
+    (name, _, version) = atom.partition('(')
+    version = version.rstrip(')')
+    for flag in ('>=', '<=', '=', '>', '<'):
+        if version.startswith(flag):
+            return (name, flag, version[len(flag):])
+    return (name, '', version)
+
+
 class GetNameVersion(object):
     ''' get name, version and arch from pbs-likes file
 
@@ -372,6 +1238,113 @@ class GetNameVersion(object):
             self.version = version_major + '-' + version_rel
 
 
+class _DirEntry(object):
+    ''' minimal DirEntry of os.listdir, used if scandir is not available '''
+    def __init__(self, dir_, name):
+        self.name = name
+        self.path = os.path.join(dir_, name)
+        self._lstat = None
+
+    def stat(self, follow_symlinks=True):
+        if follow_symlinks:
+            return os.stat(self.path)
+        if self._lstat is None:
+            self._lstat = os.lstat(self.path)
+        return self._lstat
+
+    def is_symlink(self):
+        return (self.stat(follow_symlinks=False).st_mode & 0o170000) == 0o120000
+
+    def is_dir(self, follow_symlinks=True):
+        if follow_symlinks:
+            return os.path.isdir(self.path)
+        return (self.stat(follow_symlinks=False).st_mode & 0o170000) == 0o040000
+
+    def is_file(self, follow_symlinks=True):
+        if follow_symlinks:
+            return os.path.isfile(self.path)
+        return (self.stat(follow_symlinks=False).st_mode & 0o170000) == 0o100000
+
+
+def _scandir(indir):
+    if scandir is not None:
+        return scandir(indir)
+    return [_DirEntry(indir, x) for x in os.listdir(indir)]
+
+
+def scan_dir(indir, type_='file', dirs=None):
+    ''' walk directory in one pass with scandir
+
+    Like os.walk, symlinks to directory are not followed and not yielded.
+    Types of entries are got from d_type cached by scandir, only symlinks
+    need extra stat.
+
+    Args:
+      indir: string, path to directory
+      type_: string, type of file, such as: file, link, None for any
+      dirs: dict, if given, mtime of every directory is recorded into it
+
+    Returns:
+      yield generator, contains tuples (path, name, category), category is
+      the first directory below indir, '' for files directly in indir
+
+    '''
+    stack = [(indir, '')]
+    if dirs is not None:
+        dirs[indir] = os.stat(indir).st_mtime
+    while stack:
+        dir_, category = stack.pop()
+        try:
+            entries = _scandir(dir_)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append((entry.path, category or entry.name))
+                if dirs is not None:
+                    dirs[entry.path] = entry.stat(follow_symlinks=False).st_mtime
+                continue
+            if entry.is_symlink() and entry.is_dir():
+                continue
+            if type_ == 'file' and not entry.is_file():
+                continue
+            if type_ == 'link' and not entry.is_symlink():
+                continue
+            yield (entry.path, entry.name, category)
+        # Keep order of os.walk
+        stack.extend(reversed(subdirs))
+
+
+PkgRecord = collections.namedtuple('PkgRecord', 'name version arch suffix path category')
+
+
+def scan_pkgs(indir, suffix=None, dirs=None):
+    ''' find all the pbsfile-likes files in directory, in one pass
+
+    Args:
+      indir: string, path to directory
+      suffix: string, the suffix of file
+      dirs: dict, if given, mtime of every directory is recorded into it
+
+    Returns:
+      yield generator, contains PkgRecord items
+
+    To use:
+      >>> import ybs.utils
+      >>> for x in ybs.utils.scan_pkgs('/var/ybs/packages', '.ypk'):
+      ...     print x
+      PkgRecord(name='ypkg2', version='20130301', arch='x86_64', suffix='.ypk', path='/var/ybs/packages/stable/y/ypkg2/ypkg2_20130301-x86_64.ypk', category='stable')
+
+    '''
+    get = GetNameVersion()
+    for path, name, category in scan_dir(indir, 'file', dirs):
+        if suffix is not None and not name.endswith(suffix):
+            continue
+        get.parse(name)
+        yield PkgRecord(get.name, get.version, get.arch, os.path.splitext(name)[1], path, category)
+
+
 def xfiles_in_dir(indir, suffix=None, type_='file'):
     ''' find all the files in directory
     
@@ -386,21 +1359,9 @@ def xfiles_in_dir(indir, suffix=None, type_='file'):
       yield generator
 
     '''
-    res = ''
-    if not is_empty_dir(indir):
-        for root, dirs, files in os.walk(indir):
-            for file_ in files:
-                absfile = (os.path.join(root, file_))
-                if type_ == 'file' and os.path.isfile(absfile):
-                    res = absfile
-                if type_ == 'link' and os.path.islink(absfile):
-                    res = absfile
-                if res:
-                    if suffix is not None:
-                        if res.endswith(suffix):
-                            yield res
-                    else:
-                        yield res
+    for path, name, _ in scan_dir(indir, type_):
+        if suffix is None or name.endswith(suffix):
+            yield path
 
 
 def pkgs_in_dir(indir, suffix, filter_by=None):
@@ -420,21 +1381,18 @@ def pkgs_in_dir(indir, suffix, filter_by=None):
       ['/tmp/test/HTML-Parser_3.69-x86_64.ypk', '/tmp/test/HTTP-Cookies_6.01-any.ypk']
 
     '''
-    result = [x for x in xfiles_in_dir(indir, suffix)]
     if filter_by is None:
-        return result
+        return [x for x in xfiles_in_dir(indir, suffix)]
     if filter_by == 'version':
         result_filter = {}
         record = {}
-        pbsfile = PbsFile()
-        for f in result:
-            pbsfile.parse(f)
-            name, version = pbsfile.name, pbsfile.version
-            if name in record:
-                if compare_version(version, record[name]) != '>':
+        for pkg in scan_pkgs(indir, suffix):
+            key = version_key(pkg.version)
+            if pkg.name in record:
+                if key <= record[pkg.name]:
                     continue
-            result_filter[name] = f
-            record[name] = version
+            result_filter[pkg.name] = pkg.path
+            record[pkg.name] = key
         return [x for x in result_filter.viewvalues()]
 
 
@@ -454,20 +1412,120 @@ def file_in_dir(indir, filename):
       ['/var/ybs/packages/h/HTML-Parser/HTML-Parser_3.69-x86_64.ypk']
 
     '''
-    for root, dirs, files in os.walk(indir):
-        for f in files:
-            if f == filename:
-                return os.path.join(root, f)
+    for path, name, _ in scan_dir(indir, type_=None):
+        if name == filename:
+            return path
+
+
+class PbsLib(dict):
+    ''' map of pbslib
+
+    Keys are package names, values are versions in ascending order, the
+    same as a dict. Path of every version is recorded while scanning.
+
+    Attributes:
+      paths: dict mapping, keys are (name, version), values are absolute
+        paths to pbsfiles
+
+    Methods:
+      path: get path to pbsfile of package
+
+    To use:
+      >>> import ybs.utils
+      >>> pbslib = ybs.utils.parse_pbslib('/var/ybs/pbslib')
+      >>> pbslib['leafpad']
+      ['0.8.18.1']
+      >>> pbslib.path('leafpad')
+      '/var/ybs/pbslib/app-editors/leafpad/leafpad_0.8.18.1.pbs'
+
+    '''
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.paths = {}
+
+    def path(self, name, version=None):
+        ''' get path to pbsfile of package
+
+        Args:
+          name: string, name of package
+          version: string, version of package, defaults to the max one
+
+        Returns:
+          None or string of absolute path
+
+        '''
+        if version is None:
+            version = self[name][-1]
+        return self.paths.get((name, version))
+
 
+def _load_pbslib_index(index, indir, suffix):
+    ''' load PbsLib from index file, if no directory of pbslib changed
 
-def parse_pbslib(indir, suffix='.pbs'):
+    Returns:
+      None or PbsLib object
+
+    '''
+    # A truncated or foreign index raises almost anything, it is only a cache
+    try:
+        with open(index, 'rb') as f:
+            data = cPickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(data, dict) or not all(x in data for x in ('dirs', 'versions', 'paths')):
+        return None
+    if data.get('indir') != indir or data.get('suffix') != suffix:
+        return None
+    # Adding, removing or renaming a file changes mtime of its parent
+    # directory, so stat() of recorded directories is enough.
+    for dir_, mtime in data['dirs'].iteritems():
+        try:
+            if os.stat(dir_).st_mtime != mtime:
+                return None
+        except OSError:
+            return None
+    pbslib = PbsLib(data['versions'])
+    pbslib.paths = data['paths']
+    return pbslib
+
+
+def _save_pbslib_index(index, indir, suffix, pbslib, dirs):
+    ''' save PbsLib to index file, do nothing if it is not writable '''
+    data = {'indir': indir, 'suffix': suffix, 'dirs': dirs,
+            'versions': dict(pbslib), 'paths': pbslib.paths}
+    tmpfile = None
+    try:
+        dir_ = os.path.dirname(index)
+        if not os.path.isdir(dir_):
+            os.makedirs(dir_)
+        # Unique name, concurrent runs must not write the same temporary file
+        fd, tmpfile = tempfile.mkstemp(prefix=os.path.basename(index) + '.', dir=dir_)
+        with os.fdopen(fd, 'wb') as f:
+            cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+        os.chmod(tmpfile, 0644)
+        os.rename(tmpfile, index)
+    except (IOError, OSError):
+        if tmpfile is not None and os.path.exists(tmpfile):
+            try:
+                os.unlink(tmpfile)
+            except OSError:
+                pass
+
+
+def parse_pbslib(indir, suffix='.pbs', index=None):
     ''' find all the pbsfile in given directory
 
+    The result of PBSLIB_PATH is saved to index file next to depend.db,
+    and reused until a directory of pbslib is modified.
+
     Arg:
       indir: string, path to directory
+      suffix: string, the suffix of file
+      index: string, path to index file, defaults to settings.__pbslib_index__
+        for PBSLIB_PATH, None for others
 
     Return:
-      dict mapping, keys are package names, value are versions in ascending order
+      PbsLib, dict mapping, keys are package names, value are versions in ascending order
 
     To use:
       >>> import ybs.utils
@@ -475,20 +1533,25 @@ def parse_pbslib(indir, suffix='.pbs'):
       {'gtk-vnc': ['0.5.1-rc1','0.5.1','0.5.2'], 'epdfview': ['0.1.7']}
 
     '''
-    pbsfiles = {}
-    pbsfile = PbsFile()
-    for f in pkgs_in_dir(indir, suffix):
-        pbsfile.parse(f)
-        name, version = pbsfile.name, pbsfile.version
-        if name in pbsfiles:
-            pbsfiles[name].append(version)
-        else:
-            pbsfiles[name] = [version]
-    # Return pbsfiles
-    for item in pbsfiles:
-        item_versions = pbsfiles[item]
-        pbsfiles[item] = sorted_version(item_versions)
-    return pbsfiles
+    indir = os.path.abspath(indir)
+    if index is None and suffix == '.pbs' and settings.__pbslib_path__ and \
+            indir == os.path.abspath(settings.__pbslib_path__):
+        index = settings.__pbslib_index__
+    if index is not None:
+        pbslib = _load_pbslib_index(index, indir, suffix)
+        if pbslib is not None:
+            return pbslib
+
+    pbslib = PbsLib()
+    dirs = {}
+    for pkg in scan_pkgs(indir, suffix, dirs):
+        pbslib.setdefault(pkg.name, []).append(pkg.version)
+        pbslib.paths.setdefault((pkg.name, pkg.version), pkg.path)
+    for item in pbslib:
+        pbslib[item] = sorted_version(pbslib[item])
+    if index is not None:
+        _save_pbslib_index(index, indir, suffix, pbslib, dirs)
+    return pbslib
 
 
 def minimum_version(inlist):
@@ -506,12 +1569,25 @@ def minimum_version(inlist):
       '1-rc1'
 
     '''
-    result = inlist[0]
-    for i in inlist:
-        ret = compare_version(i, result)
-        if ret == '<':
-            result = i
-    return result
+    return min(inlist, key=version_key)
+
+
+def maximum_version(inlist):
+    ''' find maximum value in list of versions
+
+    Arg:
+      list of versions
+
+    Return:
+      string of maxinum version
+
+    To use:
+      >>> import ybs.utils
+      >>> ybs.utils.maximum_version(['1', '3', '2', '1-rc1'])
+      '3'
+
+    '''
+    return max(inlist, key=version_key)
 
 
 def sorted_version(inlist):
@@ -529,16 +1605,246 @@ def sorted_version(inlist):
       ['1-rc1', '1', '1-r1']
 
     '''
-    result = []
-    length = len(inlist)
-    if length == 1 or length == 0:
-        return inlist
-    elif length > 1:
-        while inlist:
-            ret = minimum_version(inlist)
-            result.append(ret)
-            inlist.remove(ret)
-    return result
+    return sorted(inlist, key=version_key)
+
+
+def parse_pbs_fields(lines):
+    ''' parse 'KEY=value' lines printed by dosource
+
+    Args:
+      lines: iterator of strings
+
+    Returns:
+      dict mapping, keys are field names, values are strings
+
+    '''
+    fields = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        (key, _, value) = line.partition("=")
+        fields[key] = ' '.join(value.split())
+    return fields
+
+
+class PbsCache(_SqliteCache):
+    ''' persistent cache of fields sourced from pbsfiles
+
+    Each pbsfile is sourced by dosource only once, its fields are kept
+    in memory and in dbfile, keyed by (realpath, size, mtime). An edited
+    pbsfile does not match its entry any more, so it is sourced again.
+    If dbfile can not be written (e.g. not running as root), only the
+    memory cache is used.
+
+    Attributes:
+      dbfile: string, path to cache database
+      dbtable: string, table of cache database
+
+    Methods:
+      load: get fields of pbsfile, source it if not cached
+      lookup: get cached fields of pbsfile
+      store: save fields of pbsfile
+      store_many: save fields of a lot of pbsfiles
+
+    To Use:
+      >>> import ybs.utils
+      >>> pbsfile = ybs.utils.PbsFile()
+      >>> pbsfile.parse('/var/ybs/pbslib/app-editors/leafpad/leafpad_0.8.18.1.pbs')
+      >>> ybs.utils.pbs_cache.load(pbsfile)['LICENSE']
+      'GPL'
+
+    '''
+    schema = "CREATE TABLE IF NOT EXISTS {} (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, fields TEXT);"
+
+    def __init__(self, dbfile=settings.__pbs_cache_db__, dbtable=settings.__pbs_cache_db_table__):
+        _SqliteCache.__init__(self, dbfile, dbtable)
+        self.memory = {}
+
+    def __repr__(self):
+        return "class '{}' for caching fields of pbsfile".format(self.__class__.__name__)
+
+    __str__ = __repr__
+
+    def lookup(self, path, size, mtime):
+        ''' get cached fields of pbsfile
+
+        Args:
+          path: string, realpath to pbsfile
+          size: integer, size of pbsfile
+          mtime: float, mtime of pbsfile
+
+        Returns:
+          None or dict mapping of fields
+
+        '''
+        key = (path, size, mtime)
+        if key in self.memory:
+            return self.memory[key]
+        conn = self._connect()
+        if conn is None:
+            return None
+        try:
+            res = conn.execute("SELECT fields FROM {} WHERE path = ? AND size = ? AND mtime = ?".format(self.dbtable),
+                               key).fetchone()
+        except sqlite3.Error:
+            return None
+        if res is None:
+            return None
+        fields = parse_pbs_fields(res[0].split('\n'))
+        self.memory[key] = fields
+        return fields
+
+    def store(self, path, size, mtime, fields):
+        ''' save fields of pbsfile
+
+        Args:
+          path: string, realpath to pbsfile
+          size: integer, size of pbsfile
+          mtime: float, mtime of pbsfile
+          fields: dict mapping of fields
+
+        '''
+        self.store_many([(path, size, mtime, fields)])
+
+    def store_many(self, entries):
+        ''' save fields of a lot of pbsfiles in one short transaction
+
+        Write lock of dbfile is held only while rows are inserted, never
+        while pbsfiles are sourced.
+
+        Args:
+          entries: list, tuples (path, size, mtime, fields)
+
+        '''
+        rows = []
+        for path, size, mtime, fields in entries:
+            self.memory[(path, size, mtime)] = fields
+            text = '\n'.join('{}={}'.format(k, v) for k, v in fields.iteritems())
+            rows.append((path, size, mtime, text))
+        conn = self._connect()
+        if conn is None or not rows:
+            return
+        try:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO {} (path, size, mtime, fields) VALUES (?, ?, ?, ?)".format(
+                    self.dbtable), rows)
+        except sqlite3.Error:
+            pass
+
+    def load(self, pbsfile):
+        ''' get fields of pbsfile, source it if not cached
+
+        Args:
+          pbsfile: PbsFile object, which is parsed
+
+        Returns:
+          dict mapping of fields
+
+        '''
+        st = os.stat(pbsfile.path)
+        fields = self.lookup(pbsfile.path, st.st_size, st.st_mtime)
+        if fields is None:
+            cmd = ['dosource', pbsfile.path, pbsfile.name, pbsfile.version_major, pbsfile.version_rel]
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+            fields = parse_pbs_fields(proc.communicate()[0].split('\n'))
+            self.store(pbsfile.path, st.st_size, st.st_mtime, fields)
+        return fields
+
+    def load_all(self, pbsfiles):
+        ''' get fields of a lot of pbsfiles at once
+
+        Pbsfiles not cached are sourced by one 'dosource --batch' process.
+        Fields are assigned to pbsfile.fields, so pbsfile.get() runs no
+        subprocess any more.
+
+        Args:
+          pbsfiles: list of PbsFile objects, which are parsed
+
+        '''
+        misses = []
+        for pbsfile in pbsfiles:
+            st = os.stat(pbsfile.path)
+            pbsfile.fields = self.lookup(pbsfile.path, st.st_size, st.st_mtime)
+            if pbsfile.fields is None:
+                misses.append((pbsfile, st))
+        if not misses:
+            return
+        stats = dict((pbsfile.path, st) for pbsfile, st in misses)
+        entries = []
+        for pbsfile, fields in source_pbsfiles([x[0] for x in misses]):
+            st = stats[pbsfile.path]
+            pbsfile.fields = fields
+            entries.append((pbsfile.path, st.st_size, st.st_mtime, fields))
+        # Written after sourcing finished, workers do not wait for each
+        # other on the write lock
+        self.store_many(entries)
+
+pbs_cache = PbsCache()
+
+
+def source_pbsfiles(pbsfiles, bufsize=65536):
+    ''' source a lot of pbsfiles in one 'dosource --batch' process
+
+    Each pbsfile is sourced in a clean subshell, records are read from
+    the pipe while they are printed.
+
+    Args:
+      pbsfiles: list of PbsFile objects, which are parsed
+      bufsize: integer, size of chunk read from pipe
+
+    Returns:
+      yield generator, contains tuples (pbsfile, fields), fields is a
+      dict mapping like PbsCache.load() returns
+
+    To use:
+      >>> import ybs.utils
+      >>> pbsfile = ybs.utils.PbsFile()
+      >>> pbsfile.parse('/var/ybs/pbslib/app-editors/leafpad/leafpad_0.8.18.1.pbs')
+      >>> for pbsfile, fields in ybs.utils.source_pbsfiles([pbsfile]):
+      ...     print fields['LICENSE']
+      GPL
+
+    '''
+    proc = subprocess.Popen(['dosource', '--batch'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def _feed():
+        # Feed stdin in a thread, avoid deadlock when pipes are full
+        try:
+            for pbsfile in pbsfiles:
+                proc.stdin.write('\t'.join((pbsfile.path, pbsfile.name, pbsfile.version_major,
+                                            pbsfile.version_rel)) + '\n')
+        except IOError:
+            pass
+        finally:
+            proc.stdin.close()
+
+    feeder = threading.Thread(target=_feed)
+    feeder.daemon = True
+    feeder.start()
+
+    pending = iter(pbsfiles)
+    path = None
+    fields = {}
+    rest = ''
+    while True:
+        chunk = proc.stdout.read(bufsize)
+        if not chunk:
+            break
+        tokens = (rest + chunk).split('\0')
+        rest = tokens.pop()
+        for token in tokens:
+            if path is None:
+                path = token
+            elif token:
+                (key, _, value) = token.partition("=")
+                fields[key] = ' '.join(value.split())
+            else:
+                yield (next(pending), fields)
+                path = None
+                fields = {}
+    feeder.join()
+    proc.wait()
 
 
 class PbsFile(object):
@@ -554,7 +1860,8 @@ class PbsFile(object):
 
     Methods:
       parse: 
-      get: get value of pbsfile
+      get: get value of pbsfile, fields are sourced once and cached
+           by pbs_cache
 
     To Use:
       >>> import ybs.utils
@@ -598,12 +1905,10 @@ class PbsFile(object):
         self.version_major = get.version_major
         self.version_rel = get.version_rel
         self.version = get.version
+        self.fields = None
    
     def get(self, item):
-        cmd = ['dosource', self.path, self.name, self.version_major, self.version_rel]
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-        for line in proc.stdout:
-            line = line.strip()
-            (key, _, value) = line.partition("=")
-            if item == key:
-                return value.split()
+        if self.fields is None:
+            self.fields = pbs_cache.load(self)
+        if item in self.fields:
+            return self.fields[item].split()